@@ -0,0 +1,391 @@
+"""AgiloPack packing engine — box catalogues and the dual pack-quantity formulas.
+
+Kept free of Streamlit so the UI (packquan.py) and the HTTP service (service.py)
+share one implementation.
+"""
+import math
+
+
+# ── Box Catalogue ─────────────────────────────────────────────────────────────
+BOXES_WITH_WEIGHT = {
+    "A": {"dims": (120,  80,   80),  "tare": 0.4,   "type": "Bin"},
+    "B": {"dims": (200,  180,  120), "tare": 0.5,   "type": "Bin"},
+    "C": {"dims": (300,  240,  120), "tare": 0.6,   "type": "Bin"},
+    "D": {"dims": (400,  300,  220), "tare": 0.8,   "type": "Bin"},
+    "E": {"dims": (600,  500,  400), "tare": 1.0,   "type": "Bin"},
+    "F": {"dims": (800,  600,  600), "tare": 15.0,  "type": "Customized Box/Trolley/Supplier Box"},
+    "G": {"dims": (1200, 1000, 1000),"tare": 40.0,  "type": "Customized Box/Trolley/Supplier Box"},
+    "H": {"dims": (1650, 1200, 1000),"tare": 100.0, "type": "Customized Box/Trolley/Supplier Box"},
+}
+
+BOXES_WITHOUT_WEIGHT = {
+    "A": {"dims": (120,  80,   80),  "tare": 0.0, "type": "Bin"},
+    "B": {"dims": (200,  180,  120), "tare": 0.0, "type": "Bin"},
+    "C": {"dims": (300,  240,  120), "tare": 0.0, "type": "Bin"},
+    "D": {"dims": (400,  300,  220), "tare": 0.0, "type": "Bin"},
+    "E": {"dims": (600,  500,  400), "tare": 0.0, "type": "Bin"},
+    "F": {"dims": (850,  400,  250), "tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
+    "G": {"dims": (1200, 1000, 750), "tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
+    "H": {"dims": (1500, 1200, 1000),"tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
+    "i": {"dims": (1500, 1200, 1000),"tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
+}
+
+# ── Formula Logic ─────────────────────────────────────────────────────────────
+
+def rounddown(x):
+    return math.floor(x) if x >= 0 else math.ceil(x)
+
+
+def calc_qty_with_weight(box_L, box_W, box_H, part_L, part_W, part_H, unit_weight, tare):
+    h_ratio = rounddown(box_H / part_H)
+    o1_qty = (rounddown(box_L / part_L)
+              * rounddown(box_W / part_W)
+              * (1 if h_ratio >= 1 else 0))
+    o1_wt  = round(o1_qty * unit_weight + tare, 3) if unit_weight is not None else ""
+    o2_qty = (rounddown(box_L / part_W)
+              * rounddown(box_W / part_L)
+              * (1 if h_ratio > 1 else 0))
+    o2_wt  = round(o2_qty * unit_weight + tare, 3) if unit_weight is not None else ""
+    return o1_qty, o1_wt, o2_qty, o2_wt, h_ratio
+
+
+def calc_qty_without_weight(box_L, box_W, box_H, part_L, part_W, part_H):
+    h_ratio_raw = box_H / part_H
+    rd_h = rounddown(h_ratio_raw)
+    o1_qty = (rounddown(box_L / part_L)
+              * rounddown(box_W / part_W)
+              * rd_h)
+    o2_qty = (rounddown(box_L / part_W)
+              * rounddown(box_W / part_L)
+              * rd_h)
+    return o1_qty, "", o2_qty, "", rounddown(h_ratio_raw)
+
+
+OPTION_LABELS = {1: "Option 1 (L–L)", 2: "Option 2 (L–W)"}
+
+
+def orientation_qty(part_L, part_W, part_H, boxes_catalogue, has_weight):
+    """Vectorized form of both formula engines over every part × box pair.
+
+    Mirrors calc_qty_with_weight / calc_qty_without_weight and returns the
+    Option 1 (L–L) and Option 2 (L–W) quantities as int arrays shaped
+    (n_parts, n_boxes). Part dimensions must be positive.
+    """
+    import numpy as np
+
+    pL = np.asarray(part_L, dtype=float)[:, None]
+    pW = np.asarray(part_W, dtype=float)[:, None]
+    pH = np.asarray(part_H, dtype=float)[:, None]
+    dims = np.array([b["dims"] for b in boxes_catalogue.values()], dtype=float).reshape(-1, 3)
+    bL, bW, bH = dims[:, 0][None, :], dims[:, 1][None, :], dims[:, 2][None, :]
+
+    h_ratio = np.floor(bH / pH)
+    if has_weight:
+        o1_h, o2_h = (h_ratio >= 1), (h_ratio > 1)
+    else:
+        o1_h = o2_h = h_ratio
+    o1_qty = np.floor(bL / pL) * np.floor(bW / pW) * o1_h
+    o2_qty = np.floor(bL / pW) * np.floor(bW / pL) * o2_h
+    return o1_qty.astype(np.int64), o2_qty.astype(np.int64)
+
+
+def parse_unit_weight(val):
+    """Unit weight cell → float, or None when blank / missing / not numeric."""
+    try:
+        return float(val) if val is not None and str(val).strip() not in ("", "nan") else None
+    except (ValueError, TypeError):
+        return None
+
+
+# ── Column name helpers ────────────────────────────────────────────────────────
+
+def get_col(df, *candidates):
+    """Return the first matching column name (case-insensitive strip)."""
+    cols_lower = {c.strip().lower(): c for c in df.columns}
+    for cand in candidates:
+        if cand.strip().lower() in cols_lower:
+            return cols_lower[cand.strip().lower()]
+    return None
+
+
+def part_dims(df):
+    """Length / Width / Height columns as float arrays, rejecting non-positive values."""
+    import pandas as pd
+
+    dims = [pd.to_numeric(df[get_col(df, c)]).to_numpy(dtype=float)
+            for c in ("Length", "Width", "Height")]
+    for arr in dims:
+        if not (arr > 0).all():
+            raise ValueError("Length, Width and Height must be positive numbers for every part")
+    return dims
+
+
+def results_frame(df, o1_qty, o2_qty, boxes_catalogue, has_weight, box_mode="Catalogue",
+                  box_costs=None, min_utilization=None, dims=None):
+    """Build the per part × box results from the orientation quantities of df's parts.
+
+    Alongside qty / option / box weight this adds, from the same arrays:
+      Utilization (%)    volumetric fill of the box at the best qty
+      Waste L–L / L–W    empty box volume (mm³) for each orientation
+      Cost / Part        box cost ÷ best qty, where a box cost is known
+      Util Rank          1 = best-filled box for that part
+      Part Row           1-based position of the part in df (keys parts with equal ids)
+    min_utilization drops rows below the threshold (percent).
+    """
+    import numpy as np
+    import pandas as pd
+
+    col_part_no   = get_col(df, "Part No", "Part ID", "PartNo", "Part Number")
+    col_part_desc = get_col(df, "Part Description", "Part Desc", "Description", "Part Name")
+    col_unit_wt   = get_col(df, "Unit Weight") if has_weight else None
+    part_L, part_W, part_H = part_dims(df) if dims is None else dims
+
+    box_items = list(boxes_catalogue.items())
+    n_parts, n_boxes = len(df), len(box_items)
+    box_dims = np.array([b["dims"] for _, b in box_items], dtype=float).reshape(-1, 3)
+    box_vol  = box_dims.prod(axis=1)[None, :]
+    part_vol = (part_L * part_W * part_H)[:, None]
+    tare     = np.array([b["tare"] for _, b in box_items], dtype=float)[None, :]
+
+    use_o1   = o1_qty >= o2_qty
+    best_qty = np.where(use_o1, o1_qty, o2_qty)
+    util     = best_qty * part_vol / box_vol * 100
+    waste_o1 = box_vol - o1_qty * part_vol
+    waste_o2 = box_vol - o2_qty * part_vol
+
+    order = np.argsort(-util, axis=1, kind="stable")
+    rank  = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(1, n_boxes + 1)[None, :], axis=1)
+
+    costs = [(box_costs or {}).get(k, b.get("cost")) for k, b in box_items]
+    cost  = np.array([np.nan if c is None else float(c) for c in costs])[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost_pp = np.where(best_qty > 0, cost / best_qty, np.nan)
+
+    # Part ID / Part Description — handle missing columns gracefully
+    part_no   = ([str(v).strip() for v in df[col_part_no]] if col_part_no
+                 else [f"Part {idx+1}" for idx in df.index])
+    part_desc = [str(v).strip() for v in df[col_part_desc]] if col_part_desc else [""] * n_parts
+    unit_w    = (np.array([np.nan if w is None else w for w in map(parse_unit_weight, df[col_unit_wt])])
+                 if col_unit_wt else np.full(n_parts, np.nan))
+    weight    = best_qty * unit_w[:, None] + tare
+
+    box_labels = [k if box_mode == "Manual" else f"Option {k}" for k, _ in box_items]
+    keep = (util >= min_utilization).ravel() if min_utilization else slice(None)
+    res = pd.DataFrame({
+        "Part No":          np.repeat(part_no, n_boxes),
+        "Part Description": np.repeat(part_desc, n_boxes),
+        "Part Dims (mm)":   np.repeat([f"{l:.0f}×{w:.0f}×{h:.0f}" for l, w, h in zip(part_L, part_W, part_H)],
+                                      n_boxes),
+        # Categorical keeps catalogue order for pivots and stores each label once
+        "Box":              pd.Categorical(np.tile(box_labels, n_parts), categories=box_labels),
+        "Box Dims (mm)":    np.tile([f"{b['dims'][0]}×{b['dims'][1]}×{b['dims'][2]}" for _, b in box_items],
+                                    n_parts),
+        "Best Qty / Box":   best_qty.ravel(),
+        "Best Option":      np.where(use_o1, OPTION_LABELS[1], OPTION_LABELS[2]).ravel(),
+        "Box Weight (kg)":  [round(w, 3) if w == w else "—" for w in weight.ravel().tolist()],
+        "Utilization (%)":  np.round(util, 1).ravel(),
+        "Waste L–L (mm³)":  np.round(waste_o1, 1).ravel(),
+        "Waste L–W (mm³)":  np.round(waste_o2, 1).ravel(),
+        "Cost / Part":      [c if c == c else "—" for c in np.round(cost_pp, 4).ravel().tolist()],
+        "Util Rank":        rank.ravel(),
+        "Part Row":         np.repeat(np.arange(1, n_parts + 1), n_boxes),
+    })
+    return res[keep].reset_index(drop=True)
+
+
+def run_analysis(df, box_mode, custom_box=None, custom_tare=0.0, has_weight=False,
+                 box_costs=None, custom_cost=None, min_utilization=None):
+    if box_mode == "Manual":
+        boxes_catalogue = {"Custom": {"dims": custom_box, "tare": custom_tare, "type": "Manual Entry",
+                                      "cost": custom_cost}}
+    elif has_weight:
+        boxes_catalogue = BOXES_WITH_WEIGHT
+    else:
+        boxes_catalogue = BOXES_WITHOUT_WEIGHT
+
+    dims = part_dims(df)
+    o1_qty, o2_qty = orientation_qty(*dims, boxes_catalogue, has_weight)
+    return results_frame(df, o1_qty, o2_qty, boxes_catalogue, has_weight, box_mode,
+                         box_costs, min_utilization, dims)
+
+
+# Catalogue ids used by integrations (service.py) → (box table, formula engine)
+CATALOGUES = {
+    "with_weight":    (BOXES_WITH_WEIGHT,    True),
+    "without_weight": (BOXES_WITHOUT_WEIGHT, False),
+}
+
+
+# ── Box size sweep ────────────────────────────────────────────────────────────
+
+SWEEP_MAX_CANDIDATES = 200_000
+SWEEP_CHUNK_CELLS    = 2_000_000     # parts × candidates evaluated per worker task
+
+
+def sweep_values(start, stop, step, allow_zero=False):
+    """Inclusive range of candidate sizes, e.g. sweep_values(200, 600, 50).
+
+    Sizes must be positive; allow_zero admits a 0 start (tare ranges).
+    """
+    import numpy as np
+
+    if step <= 0 or stop < start or start < 0 or (start == 0 and not allow_zero):
+        raise ValueError(f"invalid sweep range {start}–{stop} step {step}")
+    return np.arange(start, stop + step / 2, step, dtype=float)
+
+
+def pareto_mask(coverage, utilization):
+    """True for candidates not dominated on (coverage, utilization), both maximised.
+
+    Ties are all kept: every candidate sharing a front point is non-dominated.
+    """
+    import numpy as np
+
+    mask = np.zeros(len(coverage), dtype=bool)
+    best_util = -np.inf     # best utilization among strictly higher coverage
+    for cov in np.unique(coverage)[::-1]:
+        group = coverage == cov
+        group_best = utilization[group].max()
+        if group_best > best_util:
+            mask |= group & (utilization == group_best)
+            best_util = group_best
+    return mask
+
+
+def sweep_boxes(df, length_range, width_range, height_range, tare_range=None,
+                has_weight=False, workers=None):
+    """Evaluate the whole part master against every box in the L × W × H grid.
+
+    Each *_range is a (start, stop, step) tuple. In the without-weight engine an
+    L × W box and its W × L twin only swap Option 1 and Option 2, so the twins are
+    merged (written L ≥ W, like the catalogue) before evaluation. The with-weight
+    engine stacks Option 2 only when two layers fit, so there both orientations
+    are evaluated. Candidates are processed in chunks of
+    roughly SWEEP_CHUNK_CELLS part × box cells on a thread pool (numpy releases the GIL).
+    Tare only adds to box weight, so it is not part of the grid: a tare_range
+    reports the weight at both ends of the range instead.
+    Returns one row per candidate box with:
+      Coverage (%)         parts that fit at least once
+      Avg Utilization (%)  mean fill over the parts that fit
+      Avg Qty / Box        mean best qty over all parts
+      Avg Box Weight (kg)  with-weight engine only; mean over parts with a unit weight,
+                           at the lowest tare (… max tare (kg) at the highest)
+      Pareto               on the coverage × utilization front
+    sorted by coverage, then utilization.
+    """
+    import os
+    from concurrent.futures import ThreadPoolExecutor
+
+    import numpy as np
+    import pandas as pd
+
+    part_L, part_W, part_H = part_dims(df)
+    part_vol = part_L * part_W * part_H
+    grids = [sweep_values(*r) for r in (length_range, width_range, height_range)]
+    tares = sweep_values(*tare_range, allow_zero=True) if (has_weight and tare_range) else np.array([0.0])
+    n_raw = len(grids[0]) * len(grids[1]) * len(grids[2])
+    # Merging L/W twins (without-weight only) at most halves the grid
+    if n_raw > (1 if has_weight else 2) * SWEEP_MAX_CANDIDATES:
+        raise ValueError(f"{n_raw:,} candidate boxes exceeds the sweep limit of "
+                         f"{SWEEP_MAX_CANDIDATES:,} — widen the steps or narrow the ranges")
+    cand = np.array(np.meshgrid(*grids, indexing="ij")).reshape(3, -1).T
+    if not has_weight:
+        cand[:, :2] = -np.sort(-cand[:, :2], axis=1)
+        cand = np.unique(cand, axis=0)
+    if len(cand) > SWEEP_MAX_CANDIDATES:
+        raise ValueError(f"{len(cand):,} candidate boxes exceeds the sweep limit of "
+                         f"{SWEEP_MAX_CANDIDATES:,} — widen the steps or narrow the ranges")
+
+    col_unit_wt = get_col(df, "Unit Weight") if has_weight else None
+    unit_w = (np.array([np.nan if w is None else w for w in map(parse_unit_weight, df[col_unit_wt])])
+              if col_unit_wt else np.full(len(df), np.nan))
+    has_uw = ~np.isnan(unit_w)
+
+    def evaluate(lo, hi):
+        boxes = {i: {"dims": tuple(d)} for i, d in enumerate(cand[lo:hi])}
+        o1_qty, o2_qty = orientation_qty(part_L, part_W, part_H, boxes, has_weight)
+        best = np.maximum(o1_qty, o2_qty)
+        fits = best > 0
+        n_fit = fits.sum(axis=0)
+        util = best * part_vol[:, None] / cand[lo:hi].prod(axis=1)[None, :] * 100
+        with np.errstate(invalid="ignore"):
+            avg_util = np.where(n_fit > 0, (util * fits).sum(axis=0) / n_fit, 0.0)
+            qty_wt = np.where(has_uw[:, None], best * np.nan_to_num(unit_w)[:, None], 0).sum(axis=0)
+        return n_fit / max(len(df), 1) * 100, avg_util, best.mean(axis=0), qty_wt
+
+    chunk = max(1, SWEEP_CHUNK_CELLS // max(len(df), 1))
+    bounds = [(lo, min(lo + chunk, len(cand))) for lo in range(0, len(cand), chunk)]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        parts = list(pool.map(lambda b: evaluate(*b), bounds))
+    coverage, avg_util, avg_qty, qty_wt = (np.concatenate(cols) for cols in zip(*parts))
+
+    res = pd.DataFrame({
+        "Box L (mm)":          cand[:, 0],
+        "Box W (mm)":          cand[:, 1],
+        "Box H (mm)":          cand[:, 2],
+        "Coverage (%)":        np.round(coverage, 1),
+        "Avg Utilization (%)": np.round(avg_util, 1),
+        "Avg Qty / Box":       np.round(avg_qty, 1),
+    })
+    if has_weight and has_uw.any():
+        avg_load = qty_wt / has_uw.sum()
+        res["Avg Box Weight (kg)"] = np.round(avg_load + tares[0], 3)
+        if len(tares) > 1:
+            res["Avg Box Weight, max tare (kg)"] = np.round(avg_load + tares[-1], 3)
+    res["Pareto"] = pareto_mask(res["Coverage (%)"].to_numpy(), res["Avg Utilization (%)"].to_numpy())
+    return (res.sort_values(["Coverage (%)", "Avg Utilization (%)"], ascending=False, kind="stable")
+               .reset_index(drop=True))
+
+
+# ── Export layouts ────────────────────────────────────────────────────────────
+
+PART_KEYS = ["Part No", "Part Description", "Part Dims (mm)"]
+
+BELOW_MIN_FILL = "below min fill"
+NO_FIT         = "no box fits"
+
+
+def best_per_part(res, min_utilization=None):
+    """Compact layout — one row per part: its best-filled box (Util Rank 1).
+
+    Parts that fit no box, or whose best box is filled below min_utilization
+    (percent), keep their row with Box labelled NO_FIT / BELOW_MIN_FILL and the
+    box fields left blank. Pass the unfiltered frame so every part is present.
+    """
+    best = res[res["Util Rank"] == 1].reset_index(drop=True)
+    no_fit = best["Best Qty / Box"] == 0
+    below = (best["Utilization (%)"] < (min_utilization or 0)) & ~no_fit
+    if no_fit.any() or below.any():
+        box_cols = [c for c in best.columns if c not in PART_KEYS and c != "Part Row"]
+        best = best.astype({c: object for c in box_cols})
+        best.loc[no_fit | below, box_cols] = None
+        best.loc[no_fit, "Box"] = NO_FIT
+        best.loc[below, "Box"] = BELOW_MIN_FILL
+    return best
+
+
+def pivot_per_part(res, min_utilization=None):
+    """Wide layout — one row per input part with a qty column per box, plus the best box.
+
+    Rows are keyed on Part Row, so duplicated part-master lines stay separate. Boxes
+    filled below min_utilization (or already dropped from a filtered frame) are
+    labelled BELOW_MIN_FILL rather than left blank, which would read as "doesn't fit".
+    """
+    import pandas as pd
+
+    boxes = res["Box"].cat.categories if isinstance(res["Box"].dtype, pd.CategoricalDtype) else res["Box"].unique()
+    # A 0 qty stays 0 (doesn't fit) — only fitting boxes can be below the min fill
+    kept = res[(res["Utilization (%)"] >= (min_utilization or 0)) | (res["Best Qty / Box"] == 0)]
+    wide = (kept.pivot(index="Part Row", columns="Box", values="Best Qty / Box")
+            .reindex(index=res["Part Row"].unique(), columns=list(boxes)).astype("Int64"))
+    filtered = wide.isna()
+    if filtered.any().any():
+        wide = wide.astype(object).mask(filtered, BELOW_MIN_FILL)
+    wide.columns = [f"{b} Qty" for b in wide.columns]
+
+    parts = res.drop_duplicates("Part Row").set_index("Part Row")[PART_KEYS]
+    best = (best_per_part(res, min_utilization).set_index("Part Row")[["Box", "Utilization (%)"]]
+            .rename(columns={"Box": "Best Box", "Utilization (%)": "Best Fill (%)"}))
+    best["Best Box"] = best["Best Box"].astype(str)
+    return parts.join(wide).join(best).reset_index()
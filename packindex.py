@@ -0,0 +1,197 @@
+"""Precomputed pack-quantity index for frequently looked-up part dimensions.
+
+Standard fasteners, brackets and housings are queried over and over with the same
+L/W/H. This module stores, per catalogue, the L–L and L–W quantities for every
+box against a set of quantized part dimensions, as .npy arrays that are opened
+memory-mapped. A lookup is a binary search over the sorted key array plus a row
+read; parts whose dimensions are not in the index fall back to the engine kernel.
+
+Each index records a fingerprint of the catalogue it was built from (box dims,
+tare, engine, quantum). When BOXES_WITH_WEIGHT / BOXES_WITHOUT_WEIGHT — or a
+catalogue passed in explicitly — no longer matches, the index is rebuilt from
+its stored keys on open.
+
+Build one from a part master:
+    python packindex.py parts.xlsx --catalogue with_weight
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from packengine import CATALOGUES, get_col, orientation_qty, part_dims, results_frame
+
+INDEX_DIR     = Path(os.environ.get("AGILOPACK_INDEX_DIR", Path(__file__).parent / ".packindex"))
+QUANTUM_MM    = 1        # dims are keyed in whole quanta; off-grid dims always miss
+INDEX_VERSION = 2
+
+_KEY_BITS = 21           # per axis → 63-bit packed key, up to ~2.1 km at 1 mm quanta
+_KEY_MAX  = 1 << _KEY_BITS
+
+
+def catalogue_fingerprint(boxes_catalogue, has_weight, quantum=QUANTUM_MM):
+    payload = json.dumps({
+        "version":    INDEX_VERSION,
+        "has_weight": bool(has_weight),
+        "quantum":    float(quantum),
+        # Ordered: o1_qty / o2_qty columns follow the catalogue's box order
+        "boxes":      [[k, list(v["dims"]), v["tare"]] for k, v in boxes_catalogue.items()],
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def check_quantum(quantum):
+    """Quanta are whole millimetres, so unpacked keys equal the original dims exactly.
+
+    A fractional quantum (0.1 mm) would rebuild dims as q × 0.1, whose float error
+    can change floor(box / part) and break parity with the engine.
+    """
+    if quantum != int(quantum) or quantum < 1:
+        raise ValueError(f"quantum must be a whole number of millimetres, got {quantum}")
+    return int(quantum)
+
+
+def quantize(part_L, part_W, part_H, quantum=QUANTUM_MM):
+    """Return (packed int64 keys, on_grid mask). Keys are only meaningful where on_grid."""
+    dims = np.column_stack([np.asarray(a, dtype=float) for a in (part_L, part_W, part_H)])
+    q = np.rint(dims / quantum)
+    on_grid = (np.all(q * quantum == dims, axis=1)
+               & np.all((q > 0) & (q < _KEY_MAX), axis=1))
+    q = np.where(on_grid[:, None], q, 0).astype(np.int64)
+    keys = (q[:, 0] << (2 * _KEY_BITS)) | (q[:, 1] << _KEY_BITS) | q[:, 2]
+    return keys, on_grid
+
+
+def unpack_keys(keys, quantum=QUANTUM_MM):
+    mask = _KEY_MAX - 1
+    return ((keys >> (2 * _KEY_BITS)) * quantum,
+            ((keys >> _KEY_BITS) & mask) * quantum,
+            (keys & mask) * quantum)
+
+
+class PackIndex:
+    """Memory-mapped L–L / L–W qty per (quantized dims, box) for one catalogue."""
+
+    def __init__(self, catalogue_id, boxes_catalogue, has_weight, keys, o1_qty, o2_qty, quantum):
+        self.catalogue_id    = catalogue_id
+        self.boxes_catalogue = boxes_catalogue
+        self.has_weight      = has_weight
+        self.keys            = keys        # sorted int64, shape (n,)
+        self.o1_qty          = o1_qty      # int64, shape (n, n_boxes) — Option 1 (L–L)
+        self.o2_qty          = o2_qty      # int64, shape (n, n_boxes) — Option 2 (L–W)
+        self.quantum         = quantum
+
+    def __len__(self):
+        return len(self.keys)
+
+    # ── Build / open ──────────────────────────────────────────────────────────
+
+    @classmethod
+    def build(cls, catalogue_id, part_L, part_W, part_H, boxes_catalogue=None, has_weight=None,
+              quantum=QUANTUM_MM, root=INDEX_DIR):
+        """Precompute the index for the given part dimensions and write it to disk."""
+        boxes_catalogue, has_weight = _resolve(catalogue_id, boxes_catalogue, has_weight)
+        quantum = check_quantum(quantum)
+        keys, on_grid = quantize(part_L, part_W, part_H, quantum)
+        keys = np.unique(keys[on_grid])
+        o1_qty, o2_qty = orientation_qty(*unpack_keys(keys, quantum), boxes_catalogue, has_weight)
+
+        path = Path(root) / catalogue_id
+        path.mkdir(parents=True, exist_ok=True)
+        for name, arr in (("keys", keys), ("o1_qty", o1_qty), ("o2_qty", o2_qty)):
+            tmp = path / f"{name}.tmp.npy"
+            np.save(tmp, arr)
+            os.replace(tmp, path / f"{name}.npy")
+        # meta.json goes last so a half-written index never carries a valid fingerprint
+        meta = {
+            "fingerprint": catalogue_fingerprint(boxes_catalogue, has_weight, quantum),
+            "quantum":     quantum,
+            "boxes":       list(boxes_catalogue),
+            "entries":     int(len(keys)),
+        }
+        tmp = path / "meta.tmp.json"
+        tmp.write_text(json.dumps(meta, indent=2))
+        os.replace(tmp, path / "meta.json")
+        return cls.open(catalogue_id, boxes_catalogue, has_weight, root=root)
+
+    @classmethod
+    def open(cls, catalogue_id, boxes_catalogue=None, has_weight=None, root=INDEX_DIR):
+        """Open an index memory-mapped, rebuilding it if the catalogue changed. None if absent."""
+        boxes_catalogue, has_weight = _resolve(catalogue_id, boxes_catalogue, has_weight)
+        path = Path(root) / catalogue_id
+        try:
+            meta = json.loads((path / "meta.json").read_text())
+            quantum = check_quantum(meta.get("quantum", QUANTUM_MM))
+            stale = meta.get("fingerprint") != catalogue_fingerprint(boxes_catalogue, has_weight, quantum)
+            # A stale index is read fully into memory: build() replaces keys.npy, which
+            # Windows refuses while the file is still memory-mapped
+            keys = np.load(path / "keys.npy", mmap_mode=None if stale else "r")
+        except (OSError, ValueError):
+            return None
+
+        if stale:
+            return cls.build(catalogue_id, *unpack_keys(keys, quantum),
+                             boxes_catalogue, has_weight, quantum, root)
+
+        return cls(catalogue_id, boxes_catalogue, has_weight, keys,
+                   np.load(path / "o1_qty.npy", mmap_mode="r"),
+                   np.load(path / "o2_qty.npy", mmap_mode="r"),
+                   quantum)
+
+    # ── Lookup ────────────────────────────────────────────────────────────────
+
+    def lookup(self, part_L, part_W, part_H):
+        """Return (row, hit): index rows into o1_qty/o2_qty, and which parts were found."""
+        keys, on_grid = quantize(part_L, part_W, part_H, self.quantum)
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        row = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        hit = on_grid & (np.asarray(self.keys[row]) == keys)
+        return row, hit
+
+    def analyse(self, df, box_costs=None, min_utilization=None):
+        """Same frame as run_analysis(df, "Catalogue", ...), with hits served from the index."""
+        dims = part_dims(df)
+        row, hit = self.lookup(*dims)
+
+        n_boxes = len(self.boxes_catalogue)
+        o1_qty = np.empty((len(df), n_boxes), dtype=np.int64)
+        o2_qty = np.empty((len(df), n_boxes), dtype=np.int64)
+        o1_qty[hit] = self.o1_qty[row[hit]]
+        o2_qty[hit] = self.o2_qty[row[hit]]
+        if not hit.all():
+            miss = ~hit
+            o1_qty[miss], o2_qty[miss] = orientation_qty(*(d[miss] for d in dims),
+                                                         self.boxes_catalogue, self.has_weight)
+        return results_frame(df, o1_qty, o2_qty, self.boxes_catalogue, self.has_weight,
+                             box_costs=box_costs, min_utilization=min_utilization, dims=dims)
+
+
+def _resolve(catalogue_id, boxes_catalogue, has_weight):
+    if boxes_catalogue is None or has_weight is None:
+        default_boxes, default_weight = CATALOGUES[catalogue_id]
+        boxes_catalogue = default_boxes if boxes_catalogue is None else boxes_catalogue
+        has_weight = default_weight if has_weight is None else has_weight
+    return boxes_catalogue, has_weight
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    ap = argparse.ArgumentParser(description="Precompute the AgiloPack lookup index from a part master.")
+    ap.add_argument("parts", help="CSV or Excel file with Length, Width, Height columns")
+    ap.add_argument("--catalogue", choices=sorted(CATALOGUES), action="append",
+                    help="catalogue id (repeatable; default: all)")
+    ap.add_argument("--quantum", type=int, default=QUANTUM_MM, help="key resolution in whole mm")
+    ap.add_argument("--root", default=str(INDEX_DIR), help="index directory")
+    args = ap.parse_args()
+
+    parts = pd.read_csv(args.parts) if args.parts.endswith(".csv") else pd.read_excel(args.parts)
+    dims = [pd.to_numeric(parts[get_col(parts, c)], errors="coerce") for c in ("Length", "Width", "Height")]
+    for cid in args.catalogue or sorted(CATALOGUES):
+        idx = PackIndex.build(cid, *dims, quantum=args.quantum, root=args.root)
+        print(f"{cid}: {len(idx)} distinct dimension keys → {Path(args.root) / cid}")
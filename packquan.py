@@ -1,538 +1,152 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import pandas as pd
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import hashlib
 import io
 import math
+from pathlib import Path
+
+from packengine import (BOXES_WITH_WEIGHT, BOXES_WITHOUT_WEIGHT, best_per_part, get_col, pivot_per_part,
+                        run_analysis, sweep_boxes)
+from sharedstate import SharedState
 
 st.set_page_config(page_title="AgiloPack", layout="wide", page_icon="▪")
 
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=DM+Mono:wght@300;400;500&family=Bebas+Neue&family=DM+Sans:wght@300;400;500;600&display=swap');
+ASSETS_DIR = Path(__file__).parent / "assets"
 
-*, *::before, *::after { box-sizing: border-box; margin: 0; padding: 0; }
 
-html, body, [class*="css"], .stApp {
-    font-family: 'DM Sans', sans-serif;
-    background: #f5f2ec !important;
-    color: #111 !important;
-}
+@st.cache_resource
+def load_css(*names):
+    """Read local stylesheets once per server process and join them.
 
-.stApp::before {
-    content: '';
-    position: fixed;
-    inset: 0;
-    background-image: radial-gradient(circle, #c8c2b4 1px, transparent 1px);
-    background-size: 28px 28px;
-    opacity: 0.18;
-    pointer-events: none;
-    z-index: 0;
-}
+    Fonts are referenced by URL (app/static/fonts, see .streamlit/config.toml), so
+    the browser fetches and caches them once instead of on every rerun.
+    """
+    return "\n".join((ASSETS_DIR / n).read_text(encoding="utf-8") for n in names)
 
-.block-container {
-    max-width: 1100px !important;
-    padding: 0 2rem 5rem 2rem !important;
-    position: relative;
-    z-index: 1;
-}
 
-.masthead {
-    border-bottom: 3px solid #111;
-    padding: 4rem 0 1.4rem 0;
-    margin-bottom: 0;
-    display: flex;
-    align-items: baseline;
-    gap: 1.6rem;
-    animation: fadeSlideDown 0.5s ease both;
-}
-@keyframes fadeSlideDown {
-    from { opacity: 0; transform: translateY(-12px); }
-    to   { opacity: 1; transform: translateY(0); }
-}
-.masthead-logo {
-    font-family: 'Bebas Neue', sans-serif;
-    font-size: 4.4rem;
-    letter-spacing: 5px;
-    color: #111;
-    line-height: 1;
-}
-.masthead-accent {
-    display: inline-block;
-    width: 11px; height: 11px;
-    background: #e63329;
-    border-radius: 50%;
-    margin-bottom: 7px;
-    animation: pulse 2.5s ease-in-out infinite;
-}
-@keyframes pulse {
-    0%, 100% { transform: scale(1); opacity: 1; }
-    50%       { transform: scale(1.35); opacity: 0.7; }
-}
-.masthead-tagline {
-    font-family: 'DM Mono', monospace;
-    font-size: 0.7rem;
-    letter-spacing: 2.5px;
-    color: #999;
-    text-transform: uppercase;
-    border-left: 2px solid #ccc;
-    padding-left: 1.1rem;
-}
-.masthead-version {
-    margin-left: auto;
-    font-family: 'DM Mono', monospace;
-    font-size: 0.6rem;
-    letter-spacing: 1.5px;
-    color: #bbb;
-    text-transform: uppercase;
-    align-self: center;
-}
+st.markdown(f"<style>\n{load_css('fonts.css', 'agilopack.css')}\n</style>", unsafe_allow_html=True)
 
-.ribbon {
-    display: flex;
-    border-bottom: 1px solid #ddd;
-    margin-bottom: 3rem;
-    background: #fff;
-    animation: fadeSlideDown 0.5s 0.1s ease both;
-}
-.rib-item {
-    flex: 1;
-    padding: 0.9rem 0;
-    font-family: 'DM Mono', monospace;
-    font-size: 0.66rem;
-    letter-spacing: 1.5px;
-    text-transform: uppercase;
-    color: #bbb;
-    text-align: center;
-    border-right: 1px solid #eee;
-    position: relative;
-    transition: color 0.2s;
-}
-.rib-item:last-child { border-right: none; }
-.rib-item.active { color: #111; font-weight: 500; }
-.rib-item.active::after {
-    content: '';
-    position: absolute;
-    bottom: -1px; left: 0; right: 0;
-    height: 3px;
-    background: #e63329;
-    animation: expandX 0.35s ease both;
-}
-@keyframes expandX {
-    from { transform: scaleX(0); }
-    to   { transform: scaleX(1); }
-}
-.rib-item.done { color: #666; }
-.rib-item.done::after {
-    content: '';
-    position: absolute;
-    bottom: -1px; left: 0; right: 0;
-    height: 3px;
-    background: #111;
-}
-.rib-num {
-    display: block;
-    font-size: 1.15rem;
-    font-family: 'Bebas Neue', sans-serif;
-    letter-spacing: 2px;
-    margin-bottom: 2px;
-}
+# ── Memoized render helpers ───────────────────────────────────────────────────
 
-.sec-head {
-    display: flex;
-    align-items: center;
-    gap: 1rem;
-    margin-bottom: 0.3rem;
-    animation: fadeSlideDown 0.4s 0.15s ease both;
-}
-.sec-num {
-    font-family: 'Bebas Neue', sans-serif;
-    font-size: 5.5rem;
-    line-height: 1;
-    color: #e8e4dc;
-    letter-spacing: 2px;
-    user-select: none;
-}
-.sec-title {
-    font-family: 'Bebas Neue', sans-serif;
-    font-size: 2.1rem;
-    letter-spacing: 2.5px;
-    color: #111;
-}
-.sec-rule {
-    border: none;
-    border-top: 1px solid #d5d0c8;
-    margin-bottom: 2rem;
-}
-.sec-desc {
-    font-size: 0.86rem;
-    color: #777;
-    line-height: 1.65;
-    margin-bottom: 2rem;
-    max-width: 560px;
-    animation: fadeSlideDown 0.4s 0.2s ease both;
-}
+@st.cache_data
+def catalogue_grid_html(has_weight):
+    """Build the catalogue card grid once per engine; it only depends on the box tables."""
+    catalogue = BOXES_WITH_WEIGHT if has_weight else BOXES_WITHOUT_WEIGHT
+    grid_html = '<div class="bx-grid">'
+    for k, v in catalogue.items():
+        d = v["dims"]
+        tare_str = f"tare: {v['tare']} kg" if has_weight else "no tare"
+        grid_html += f'''<div class="bx-item">
+            <div class="bx-name">Option {k}</div>
+            <div class="bx-dims">{d[0]}×{d[1]}×{d[2]} mm</div>
+            <div class="bx-type">{v["type"]}</div>
+            <div class="bx-tare">{tare_str}</div>
+        </div>'''
+    grid_html += '</div>'
+    return grid_html
 
-.bx-grid {
-    display: grid;
-    grid-template-columns: repeat(4, 1fr);
-    gap: 0;
-    border: 1px solid #ddd;
-    margin-bottom: 2rem;
-    overflow: hidden;
-    background: #fff;
-    animation: fadeSlideDown 0.4s 0.2s ease both;
-}
-.bx-item {
-    padding: 1.1rem 1.3rem;
-    border-right: 1px solid #eee;
-    border-bottom: 1px solid #eee;
-    background: #fff;
-    transition: background 0.15s;
-    position: relative;
-    overflow: hidden;
-}
-.bx-item::before {
-    content: '';
-    position: absolute;
-    inset: 0;
-    background: #e63329;
-    transform: scaleX(0);
-    transform-origin: left;
-    transition: transform 0.2s ease;
-    z-index: 0;
-}
-.bx-item:hover::before { transform: scaleX(1); }
-.bx-item:hover .bx-name,
-.bx-item:hover .bx-dims,
-.bx-item:hover .bx-type,
-.bx-item:hover .bx-tare { color: #fff; }
-.bx-item:nth-child(4n) { border-right: none; }
-.bx-name {
-    font-family: 'Bebas Neue', sans-serif;
-    font-size: 1.05rem;
-    letter-spacing: 1.5px;
-    color: #111;
-    margin-bottom: 4px;
-    position: relative; z-index: 1;
-    transition: color 0.15s;
-}
-.bx-dims {
-    font-family: 'DM Mono', monospace;
-    font-size: 0.68rem;
-    color: #999;
-    position: relative; z-index: 1;
-    transition: color 0.15s;
-}
-.bx-type {
-    font-family: 'DM Mono', monospace;
-    font-size: 0.6rem;
-    color: #bbb;
-    margin-top: 3px;
-    position: relative; z-index: 1;
-    transition: color 0.15s;
-}
-.bx-tare {
-    font-family: 'DM Mono', monospace;
-    font-size: 0.58rem;
-    color: #ccc;
-    margin-top: 2px;
-    position: relative; z-index: 1;
-    transition: color 0.15s;
-}
 
-.stat-grid {
-    display: grid;
-    grid-template-columns: repeat(4, 1fr);
-    gap: 0;
-    border: 1px solid #ddd;
-    overflow: hidden;
-    margin-bottom: 2.5rem;
-    background: #fff;
-    animation: fadeSlideDown 0.4s 0.1s ease both;
-}
-.stat-cell {
-    padding: 1.6rem 1.8rem;
-    border-right: 1px solid #eee;
-    position: relative;
-}
-.stat-cell:last-child { border-right: none; }
-.stat-cell::after {
-    content: '';
-    position: absolute;
-    top: 0; left: 0;
-    width: 3px; height: 100%;
-    background: #e8e4dc;
-}
-.stat-cell:first-child::after { background: #111; }
-.stat-label {
-    font-family: 'DM Mono', monospace;
-    font-size: 0.6rem;
-    letter-spacing: 2px;
-    text-transform: uppercase;
-    color: #aaa;
-    margin-bottom: 8px;
-}
-.stat-value {
-    font-family: 'Bebas Neue', sans-serif;
-    font-size: 2.6rem;
-    letter-spacing: 1px;
-    color: #111;
-    line-height: 1;
-}
-.stat-value.red { color: #e63329; }
-
-.stButton > button {
-    background: #111 !important;
-    color: #f5f2ec !important;
-    border: none !important;
-    border-radius: 0 !important;
-    font-family: 'DM Mono', monospace !important;
-    font-size: 0.76rem !important;
-    letter-spacing: 2.5px !important;
-    text-transform: uppercase !important;
-    padding: 0.8rem 2.8rem !important;
-    transition: background 0.2s, letter-spacing 0.2s !important;
-}
-.stButton > button:hover {
-    background: #e63329 !important;
-    letter-spacing: 3.5px !important;
-}
+EXPORT_COLS = [
+    "Part No", "Part Description", "Part Dims (mm)",
+    "Box", "Box Dims (mm)",
+    "Best Qty / Box", "Best Option", "Box Weight (kg)",
+    "Utilization (%)", "Waste L–L (mm³)", "Waste L–W (mm³)", "Cost / Part", "Util Rank",
+]
 
-[data-testid="stDownloadButton"] > button {
-    background: #1a7d48 !important;
-    color: #fff !important;
-}
-[data-testid="stDownloadButton"] > button:hover {
-    background: #15603a !important;
-}
 
-div[data-testid="stSelectbox"] label,
-div[data-testid="stNumberInput"] label,
-div[data-testid="stFileUploader"] label,
-.stRadio label, [data-testid="stWidgetLabel"] p {
-    font-family: 'DM Mono', monospace !important;
-    font-size: 0.67rem !important;
-    letter-spacing: 2px !important;
-    text-transform: uppercase !important;
-    color: #888 !important;
+EXPORT_LAYOUTS = {
+    "Full · part × box":         "full",
+    "Compact · best box / part": "best",
+    "Wide · qty per box":        "wide",
 }
 
-div[data-testid="stSelectbox"] > div > div,
-div[data-testid="stNumberInput"] input {
-    background: #fff !important;
-    border: 1px solid #ddd !important;
-    border-radius: 0 !important;
-    font-family: 'DM Mono', monospace !important;
-}
 
-[data-testid="stFileUploader"] {
-    border: 2px dashed #ccc !important;
-    border-radius: 0 !important;
-    background: #fff !important;
-}
-[data-testid="stFileUploader"]:hover { border-color: #e63329 !important; }
+def export_frame(res_df, layout, min_util=None):
+    """res_df is the unfiltered result; min_util hides (full) or labels (best / wide) low fills."""
+    if layout == "best":
+        return best_per_part(res_df, min_util)[EXPORT_COLS]
+    if layout == "wide":
+        return pivot_per_part(res_df, min_util)
+    if min_util:
+        res_df = res_df[res_df["Utilization (%)"] >= min_util]
+    return res_df[EXPORT_COLS]
 
-div[data-testid="stAlert"] {
-    border-radius: 0 !important;
-    border-left: 3px solid #111 !important;
-    font-family: 'DM Mono', monospace !important;
-    font-size: 0.75rem !important;
-}
 
-.stRadio > div { gap: 0 !important; }
-.stRadio > div > label {
-    border: 1px solid #ddd !important;
-    border-right: none !important;
-    padding: 0.5rem 1rem !important;
-    font-family: 'DM Mono', monospace !important;
-    font-size: 0.68rem !important;
-    letter-spacing: 1.5px !important;
-    text-transform: uppercase !important;
-    background: #fff !important;
-    cursor: pointer;
-}
-.stRadio > div > label:last-child { border-right: 1px solid #ddd !important; }
-.stRadio > div > label:has(input:checked) {
-    background: #e63329 !important;
-    color: #fff !important;
-    border-color: #e63329 !important;
-}
+def build_excel_report(res_df, layout="full", min_util=None):
+    """Stream the chosen export layout to xlsx bytes (xlsxwriter imported on demand).
 
-.weight-badge {
-    display: inline-block;
-    font-family: 'DM Mono', monospace;
-    font-size: 0.6rem;
-    letter-spacing: 1.5px;
-    text-transform: uppercase;
-    padding: 0.25rem 0.7rem;
-    margin-bottom: 1.5rem;
-    border: 1px solid;
-}
-.weight-badge.detected    { color: #1a7d48; border-color: #1a7d48; background: #f0faf5; }
-.weight-badge.not-detected { color: #999;   border-color: #ccc;    background: #fafafa; }
-
-.formula-note {
-    font-family: 'DM Mono', monospace;
-    font-size: 0.62rem;
-    letter-spacing: 1.5px;
-    color: #aaa;
-    text-transform: uppercase;
-    margin: 0.4rem 0 1.2rem 0;
-    line-height: 1.8;
-}
-.formula-note span { color: #e63329; }
-
-.dl-hint {
-    font-family: 'DM Mono', monospace;
-    font-size: 0.62rem;
-    letter-spacing: 1.5px;
-    color: #aaa;
-    text-transform: uppercase;
-    margin-top: 0.4rem;
-}
+    constant_memory flushes each row to a temp file as it is written, so rows go
+    out strictly in order and the workbook never holds the whole sheet in memory.
+    """
+    import xlsxwriter
 
-footer { display: none !important; }
-#MainMenu { display: none !important; }
-</style>
-""", unsafe_allow_html=True)
+    out_df = export_frame(res_df, layout, min_util)
+    cols = list(out_df.columns)
+    output = io.BytesIO()
+    wb = xlsxwriter.Workbook(output, {'constant_memory': True})
+    ws = wb.add_worksheet('AgiloPack')
+    hdr_fmt = wb.add_format({'bold': True, 'bg_color': '#111111', 'font_color': '#cccccc',
+                             'font_name': 'Arial', 'font_size': 9, 'border': 1})
+    for ci, col in enumerate(cols):
+        ws.set_column(ci, ci, max(len(col) + 2, 14))
+    ws.write_row(0, 0, cols, hdr_fmt)
+    body = out_df.astype(object).where(out_df.notna(), None)
+    for ri, row in enumerate(body.itertuples(index=False, name=None), start=1):
+        ws.write_row(ri, 0, row)
+    wb.close()
+    return output.getvalue()
 
-# ── Box Catalogue ─────────────────────────────────────────────────────────────
-BOXES_WITH_WEIGHT = {
-    "A": {"dims": (120,  80,   80),  "tare": 0.4,   "type": "Bin"},
-    "B": {"dims": (200,  180,  120), "tare": 0.5,   "type": "Bin"},
-    "C": {"dims": (300,  240,  120), "tare": 0.6,   "type": "Bin"},
-    "D": {"dims": (400,  300,  220), "tare": 0.8,   "type": "Bin"},
-    "E": {"dims": (600,  500,  400), "tare": 1.0,   "type": "Bin"},
-    "F": {"dims": (800,  600,  600), "tare": 15.0,  "type": "Customized Box/Trolley/Supplier Box"},
-    "G": {"dims": (1200, 1000, 1000),"tare": 40.0,  "type": "Customized Box/Trolley/Supplier Box"},
-    "H": {"dims": (1650, 1200, 1000),"tare": 100.0, "type": "Customized Box/Trolley/Supplier Box"},
-}
 
-BOXES_WITHOUT_WEIGHT = {
-    "A": {"dims": (120,  80,   80),  "tare": 0.0, "type": "Bin"},
-    "B": {"dims": (200,  180,  120), "tare": 0.0, "type": "Bin"},
-    "C": {"dims": (300,  240,  120), "tare": 0.0, "type": "Bin"},
-    "D": {"dims": (400,  300,  220), "tare": 0.0, "type": "Bin"},
-    "E": {"dims": (600,  500,  400), "tare": 0.0, "type": "Bin"},
-    "F": {"dims": (850,  400,  250), "tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
-    "G": {"dims": (1200, 1000, 750), "tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
-    "H": {"dims": (1500, 1200, 1000),"tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
-    "i": {"dims": (1500, 1200, 1000),"tare": 0.0, "type": "Customized Box/Trolley/Supplier Box"},
-}
+# ── Shared computation ────────────────────────────────────────────────────────
 
-# ── Formula Logic ─────────────────────────────────────────────────────────────
-
-def rounddown(x):
-    return math.floor(x) if x >= 0 else math.ceil(x)
-
-
-def calc_qty_with_weight(box_L, box_W, box_H, part_L, part_W, part_H, unit_weight, tare):
-    h_ratio = rounddown(box_H / part_H)
-    o1_qty = (rounddown(box_L / part_L)
-              * rounddown(box_W / part_W)
-              * (1 if h_ratio >= 1 else 0))
-    o1_wt  = round(o1_qty * unit_weight + tare, 3) if unit_weight is not None else ""
-    o2_qty = (rounddown(box_L / part_W)
-              * rounddown(box_W / part_L)
-              * (1 if h_ratio > 1 else 0))
-    o2_wt  = round(o2_qty * unit_weight + tare, 3) if unit_weight is not None else ""
-    return o1_qty, o1_wt, o2_qty, o2_wt, h_ratio
-
-
-def calc_qty_without_weight(box_L, box_W, box_H, part_L, part_W, part_H):
-    h_ratio_raw = box_H / part_H
-    rd_h = rounddown(h_ratio_raw)
-    o1_qty = (rounddown(box_L / part_L)
-              * rounddown(box_W / part_W)
-              * rd_h)
-    o2_qty = (rounddown(box_L / part_W)
-              * rounddown(box_W / part_L)
-              * rd_h)
-    return o1_qty, "", o2_qty, "", rounddown(h_ratio_raw)
-
-
-# ── Column name helpers ────────────────────────────────────────────────────────
-
-def get_col(df, *candidates):
-    """Return the first matching column name (case-insensitive strip)."""
-    cols_lower = {c.strip().lower(): c for c in df.columns}
-    for cand in candidates:
-        if cand.strip().lower() in cols_lower:
-            return cols_lower[cand.strip().lower()]
-    return None
-
-
-def run_analysis(df, box_mode, custom_box=None, custom_tare=0.0, has_weight=False):
-    results = []
-
-    # Resolve column names flexibly
-    col_part_no   = get_col(df, "Part No", "Part ID", "PartNo", "Part Number")
-    col_part_desc = get_col(df, "Part Description", "Part Desc", "Description", "Part Name")
-    col_length    = get_col(df, "Length")
-    col_width     = get_col(df, "Width")
-    col_height    = get_col(df, "Height")
-    col_unit_wt   = get_col(df, "Unit Weight") if has_weight else None
-
-    if box_mode == "Manual":
-        boxes_catalogue = {"Custom": {"dims": custom_box, "tare": custom_tare, "type": "Manual Entry"}}
-    elif has_weight:
-        boxes_catalogue = BOXES_WITH_WEIGHT
-    else:
-        boxes_catalogue = BOXES_WITHOUT_WEIGHT
+@st.cache_resource
+def shared_state():
+    """One SharedState per server process, reused by every session."""
+    return SharedState()
 
-    for idx, row in df.iterrows():
-        part_L = float(row[col_length])
-        part_W = float(row[col_width])
-        part_H = float(row[col_height])
 
-        # Part ID / Part Description — handle missing columns gracefully
-        part_no   = str(row[col_part_no]).strip()   if col_part_no   else f"Part {idx+1}"
-        part_desc = str(row[col_part_desc]).strip()  if col_part_desc else ""
+SHARED = shared_state()
 
-        unit_w = None
-        if has_weight and col_unit_wt:
-            val = row.get(col_unit_wt, None)
-            try:
-                unit_w = float(val) if val is not None and str(val).strip() not in ("", "nan") else None
-            except (ValueError, TypeError):
-                unit_w = None
 
-        for bkey, bdata in boxes_catalogue.items():
-            box_L, box_W, box_H = bdata["dims"]
-            tare = bdata["tare"]
+def parse_upload(data, name):
+    """Parse an uploaded part master; the frame is shared across sessions, so never mutate it."""
+    import pandas as pd
 
-            if has_weight:
-                o1_qty, o1_wt, o2_qty, o2_wt, h_ratio = calc_qty_with_weight(
-                    box_L, box_W, box_H, part_L, part_W, part_H, unit_w, tare
-                )
-            else:
-                o1_qty, o1_wt, o2_qty, o2_wt, h_ratio = calc_qty_without_weight(
-                    box_L, box_W, box_H, part_L, part_W, part_H
-                )
+    df = pd.read_csv(io.BytesIO(data)) if name.endswith('.csv') else pd.read_excel(io.BytesIO(data))
+    df.columns = [c.strip() for c in df.columns]
+    return df
 
-            if o1_qty >= o2_qty:
-                best_option = "Option 1 (L–L)"
-                best_qty    = o1_qty
-                best_wt     = o1_wt
-            else:
-                best_option = "Option 2 (L–W)"
-                best_qty    = o2_qty
-                best_wt     = o2_wt
 
-            label = bkey if box_mode == "Manual" else f"Option {bkey}"
+def queue_notice():
+    """Placeholder plus an on_wait(position=None) callback that reports why this session is waiting."""
+    notice = st.empty()
+
+    def on_wait(position=None):
+        if position:
+            notice.info(f"⧗  Server busy — queued at position {position}, analysis starts when a slot frees up")
+        else:
+            notice.info("⧗  Server busy — another session is running this same analysis, results appear when it finishes")
+
+    return notice, on_wait
 
-            results.append({
-                "Part No":           part_no,
-                "Part Description":  part_desc,
-                "Part Dims (mm)":    f"{part_L:.0f}×{part_W:.0f}×{part_H:.0f}",
-                "Box":               label,
-                "Box Dims (mm)":     f"{box_L}×{box_W}×{box_H}",
-                "Best Qty / Box":    best_qty,
-                "Best Option":       best_option,
-                "Box Weight (kg)":   best_wt if best_wt != "" else "—",
-            })
 
-    return pd.DataFrame(results)
+def gated(compute):
+    """Run a heavy computation in one of the shared analysis slots, showing the queue if full."""
+    notice, on_wait = queue_notice()
+    with SHARED.gate.slot(on_wait):
+        notice.empty()
+        return compute()
+
+
+def shared_get(store, key, compute):
+    """store.get_or_compute, showing the queued notice while another session computes the key."""
+    notice, on_wait = queue_notice()
+    try:
+        return store.get_or_compute(key, compute, on_wait)
+    finally:
+        notice.empty()
 
 
 # ── Session State ─────────────────────────────────────────────────────────────
@@ -578,8 +192,10 @@ if st.session_state.step == 1:
     uploaded_file = st.file_uploader("Drop part file here (CSV or Excel)", type=["csv", "xlsx"])
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file) if uploaded_file.name.endswith('.csv') else pd.read_excel(uploaded_file)
-        df.columns = [c.strip() for c in df.columns]
+        # Identical uploads from any session resolve to the same parsed frame
+        upload_bytes = uploaded_file.getvalue()
+        upload_key = (hashlib.sha256(upload_bytes).hexdigest(), uploaded_file.name.endswith('.csv'))
+        df = shared_get(SHARED.uploads, upload_key, lambda: parse_upload(upload_bytes, uploaded_file.name))
 
         has_weight = get_col(df, "Unit Weight") is not None
         has_part_no   = get_col(df, "Part No", "Part ID", "PartNo", "Part Number") is not None
@@ -612,10 +228,15 @@ if st.session_state.step == 1:
             """, unsafe_allow_html=True)
 
         st.markdown("<br>", unsafe_allow_html=True)
-        box_mode = st.radio("Box selection mode", ["Predefined Catalogue", "Manual Box Size Entry"], horizontal=False)
+        box_mode = st.radio("Box selection mode",
+                            ["Predefined Catalogue", "Manual Box Size Entry", "Box Size Sweep"],
+                            horizontal=False)
 
         custom_box  = None
         custom_tare = 0.0
+        custom_cost = None
+        box_costs   = {}
+        sweep_ranges = {}
 
         if box_mode == "Manual Box Size Entry":
             st.markdown("<br>", unsafe_allow_html=True)
@@ -626,29 +247,71 @@ if st.session_state.step == 1:
             custom_box = (bl, bw, bh)
             if has_weight:
                 custom_tare = c4.number_input("Box Tare Weight (kg)", value=0.0, step=0.1)
+            c5, _, _, _ = st.columns(4)
+            custom_cost = c5.number_input("Box Cost (per box, 0 = none)", value=0.0, min_value=0.0, step=0.1) or None
+        elif box_mode == "Box Size Sweep":
+            st.markdown("""
+            <p class="sec-desc">Every L × W × H combination in the ranges below is evaluated against the whole part master. Candidates on the <strong>coverage × average utilization</strong> Pareto front are the best trade-offs for a new standard size.</p>
+            """, unsafe_allow_html=True)
+            sweep_defaults = {"Length": (200, 800, 50), "Width": (150, 600, 50), "Height": (100, 500, 50)}
+            if has_weight:
+                sweep_defaults["Tare"] = (0.5, 0.5, 0.5)
+            for name, (lo, hi, stp) in sweep_defaults.items():
+                unit = "kg" if name == "Tare" else "mm"
+                c1, c2, c3 = st.columns(3)
+                min_size = 0.0 if name == "Tare" else 1.0     # a zero-size box has no volume
+                sweep_ranges[name] = (
+                    c1.number_input(f"{name} from ({unit})", value=float(lo), min_value=min_size, step=float(stp)),
+                    c2.number_input(f"{name} to ({unit})",   value=float(hi), min_value=min_size, step=float(stp)),
+                    c3.number_input(f"{name} step ({unit})", value=float(stp), min_value=0.01, step=float(stp)),
+                )
         else:
             st.markdown("<br>", unsafe_allow_html=True)
+            st.markdown(catalogue_grid_html(has_weight), unsafe_allow_html=True)
             catalogue = BOXES_WITH_WEIGHT if has_weight else BOXES_WITHOUT_WEIGHT
-            grid_html = '<div class="bx-grid">'
-            for k, v in catalogue.items():
-                d = v["dims"]
-                tare_str = f"tare: {v['tare']} kg" if has_weight else "no tare"
-                grid_html += f'''<div class="bx-item">
-                    <div class="bx-name">Option {k}</div>
-                    <div class="bx-dims">{d[0]}×{d[1]}×{d[2]} mm</div>
-                    <div class="bx-type">{v["type"]}</div>
-                    <div class="bx-tare">{tare_str}</div>
-                </div>'''
-            grid_html += '</div>'
-            st.markdown(grid_html, unsafe_allow_html=True)
+            with st.expander("Box costs (optional) — enables Cost / Part"):
+                cost_cols = st.columns(4)
+                for i, k in enumerate(catalogue):
+                    cost = cost_cols[i % 4].number_input(f"Option {k} cost (per box)", value=0.0,
+                                                         min_value=0.0, step=0.1, key=f"box_cost_{k}")
+                    if cost:
+                        box_costs[k] = cost
+
+        min_util = 0.0
+        if box_mode != "Box Size Sweep":
+            st.markdown("<br>", unsafe_allow_html=True)
+            min_util = st.number_input("Min Box Utilization (%) — hide boxes filled below this",
+                                       value=0.0, min_value=0.0, max_value=100.0, step=5.0)
 
         st.markdown("<br>", unsafe_allow_html=True)
         if st.button("Run Analysis →"):
-            st.session_state.data['results_df'] = run_analysis(
-                df,
-                "Catalogue" if box_mode == "Predefined Catalogue" else "Manual",
-                custom_box, custom_tare, has_weight
-            )
+            # Results are shared by content hash + settings; only misses take an analysis slot
+            if box_mode == "Box Size Sweep":
+                result_key = (upload_key, "sweep", tuple(sweep_ranges.items()), has_weight)
+                try:
+                    sweep_df = shared_get(SHARED.results, result_key, lambda: gated(lambda: sweep_boxes(
+                        df, sweep_ranges["Length"], sweep_ranges["Width"], sweep_ranges["Height"],
+                        sweep_ranges.get("Tare"), has_weight
+                    )))
+                except ValueError as e:
+                    st.error(str(e))
+                    st.stop()
+                st.session_state.data.pop('results_df', None)
+                st.session_state.data['sweep_df'] = sweep_df
+            else:
+                mode = "Catalogue" if box_mode == "Predefined Catalogue" else "Manual"
+                # min_util only filters the view, so one cached result serves every threshold
+                result_key = (upload_key, mode, custom_box, custom_tare, custom_cost,
+                              tuple(sorted(box_costs.items())), has_weight)
+                st.session_state.data.pop('sweep_df', None)
+                st.session_state.data['results_df'] = shared_get(
+                    SHARED.results, result_key, lambda: gated(lambda: run_analysis(
+                        df, mode, custom_box, custom_tare, has_weight,
+                        box_costs=box_costs or None, custom_cost=custom_cost,
+                    ))
+                )
+                st.session_state.data['min_util'] = min_util or None
+            st.session_state.data['result_key'] = result_key
             st.session_state.data['has_weight'] = has_weight
             st.session_state.step = 2
             st.rerun()
@@ -656,8 +319,76 @@ if st.session_state.step == 1:
 # ─────────────────────────────────────────────────────────────────────────────
 # STEP 2 — Results
 # ─────────────────────────────────────────────────────────────────────────────
+elif st.session_state.step == 2 and 'sweep_df' in st.session_state.data:
+    sweep_df   = st.session_state.data['sweep_df']
+    has_weight = st.session_state.data.get('has_weight', False)
+    front      = sweep_df[sweep_df["Pareto"]].drop(columns=["Pareto"])
+
+    st.markdown("""
+    <div class="sec-head">
+      <span class="sec-num">02</span>
+      <span class="sec-title">Box Size Sweep</span>
+    </div>
+    <hr class="sec-rule">
+    """, unsafe_allow_html=True)
+
+    st.markdown(f"""
+    <div class="stat-grid">
+      <div class="stat-cell">
+        <div class="stat-label">Candidates Evaluated</div>
+        <div class="stat-value">{len(sweep_df):,}</div>
+      </div>
+      <div class="stat-cell">
+        <div class="stat-label">Pareto Sizes</div>
+        <div class="stat-value red">{len(front)}</div>
+      </div>
+      <div class="stat-cell">
+        <div class="stat-label">Best Coverage</div>
+        <div class="stat-value">{sweep_df["Coverage (%)"].max():.0f}%</div>
+      </div>
+      <div class="stat-cell">
+        <div class="stat-label">Best Avg Fill</div>
+        <div class="stat-value">{sweep_df["Avg Utilization (%)"].max():.0f}%</div>
+      </div>
+    </div>
+    """, unsafe_allow_html=True)
+
+    import plotly.express as px
+
+    fig = px.scatter(
+        sweep_df, x="Coverage (%)", y="Avg Utilization (%)", color="Pareto",
+        color_discrete_map={True: "#e63329", False: "#c8c2b4"},
+        hover_data=["Box L (mm)", "Box W (mm)", "Box H (mm)", "Avg Qty / Box"],
+    )
+    fig.update_layout(plot_bgcolor="#fff", paper_bgcolor="rgba(0,0,0,0)", font_family="DM Mono",
+                      legend_title_text="Pareto front")
+    st.plotly_chart(fig, width="stretch")
+
+    st.dataframe(front, width="stretch", hide_index=True)
+
+    st.markdown("<br>", unsafe_allow_html=True)
+    col1, col2 = st.columns([1, 5])
+    with col1:
+        st.download_button(
+            "↓ Download Sweep",
+            data=shared_get(
+                SHARED.reports, (st.session_state.data['result_key'], "csv"),
+                lambda: sweep_df.to_csv(index=False).encode("utf-8")
+            ),
+            file_name='AgiloPack_Sweep.csv',
+            mime='text/csv'
+        )
+    with col2:
+        if st.button("↺ Start Over"):
+            reset_process()
+
+    st.markdown('<p class="dl-hint">CSV · All candidates · Coverage = parts fitting ≥ 1 per box · Avg Fill over fitting parts</p>',
+                unsafe_allow_html=True)
+
 elif st.session_state.step == 2:
-    res_df     = st.session_state.data['results_df']
+    all_df     = st.session_state.data['results_df']
+    min_util   = st.session_state.data.get('min_util')
+    res_df     = all_df[all_df["Utilization (%)"] >= min_util].reset_index(drop=True) if min_util else all_df
     has_weight = st.session_state.data.get('has_weight', False)
 
     st.markdown("""
@@ -678,6 +409,8 @@ elif st.session_state.step == 2:
         best_qty    = int(res_df["Best Qty / Box"].max())
         avg_qty     = res_df["Best Qty / Box"].mean()
 
+        import pandas as pd
+
         weight_numeric = pd.to_numeric(res_df["Box Weight (kg)"], errors='coerce')
         max_wt   = weight_numeric.max() if has_weight else None
         stat4_v  = f"{max_wt:.1f} kg" if (max_wt is not None and not math.isnan(max_wt)) else "N/A"
@@ -716,12 +449,15 @@ elif st.session_state.step == 2:
         for _, row in res_df.iterrows():
             qty       = int(row["Best Qty / Box"])
             qty_color = "#2a9d5c" if qty >= 10 else ("#f4a300" if qty >= 4 else ("#e63329" if qty == 0 else "#111"))
+            util      = row["Utilization (%)"]
+            util_color = "#2a9d5c" if util >= 70 else ("#f4a300" if util >= 40 else "#e63329")
             wt_disp   = str(row["Box Weight (kg)"]) if row["Box Weight (kg)"] != "—" else "—"
             if wt_disp not in ("—", "") and wt_disp != "—":
                 try:
                     wt_disp = f"{float(wt_disp)} kg"
                 except ValueError:
                     pass
+            cost_disp = row["Cost / Part"] if row["Cost / Part"] == "—" else f"{row['Cost / Part']:.4f}"
             rows_html += f"""
             <tr>
                 <td style="font-weight:600;white-space:nowrap;">{row['Part No']}</td>
@@ -732,18 +468,20 @@ elif st.session_state.step == 2:
                 <td style="font-family:'Bebas Neue',sans-serif;font-size:1.5rem;color:{qty_color};text-align:center;">{qty}</td>
                 <td style="color:#555;font-size:0.72rem;">{row['Best Option']}</td>
                 <td style="color:#333;text-align:right;white-space:nowrap;">{wt_disp}</td>
+                <td style="color:{util_color};text-align:right;white-space:nowrap;">{util:.1f}%</td>
+                <td style="color:#333;text-align:right;white-space:nowrap;">{cost_disp}</td>
             </tr>"""
 
         table_html = f"""
         <style>
-          @import url('https://fonts.googleapis.com/css2?family=DM+Mono:wght@400;500&family=Bebas+Neue&family=DM+Sans:wght@400;500&display=swap');
+          {load_css('fonts.css')}
           * {{ box-sizing: border-box; }}
           body {{ margin: 0; background: transparent; }}
           table {{ width:100%;border-collapse:collapse;font-family:'DM Mono',monospace;background:#fff;border:1px solid #ddd; }}
           thead tr {{ background:#111; }}
           th {{ font-size:0.58rem;letter-spacing:1.5px;text-transform:uppercase;color:#aaa;padding:0.9rem 1rem;text-align:left;font-weight:400;white-space:nowrap; }}
           th:nth-child(6) {{ text-align:center; }}
-          th:nth-child(8) {{ text-align:right; }}
+          th:nth-child(8), th:nth-child(9), th:nth-child(10) {{ text-align:right; }}
           td {{ padding:0.85rem 1rem;border-bottom:1px solid #f0ece5;font-size:0.74rem;color:#222;vertical-align:middle; }}
           tbody tr:hover {{ background:#faf8f4; }}
           tbody tr:last-child td {{ border-bottom:none; }}
@@ -759,6 +497,8 @@ elif st.session_state.step == 2:
               <th>Best Qty</th>
               <th>Best Option</th>
               <th>Box Weight</th>
+              <th>Fill</th>
+              <th>Cost / Part</th>
             </tr>
           </thead>
           <tbody>{rows_html}</tbody>
@@ -768,28 +508,21 @@ elif st.session_state.step == 2:
 
         st.markdown("<br>", unsafe_allow_html=True)
 
-        output = io.BytesIO()
-        export_cols = [
-            "Part No", "Part Description", "Part Dims (mm)",
-            "Box", "Box Dims (mm)",
-            "Best Qty / Box", "Best Option", "Box Weight (kg)",
-        ]
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            res_df[export_cols].to_excel(writer, index=False, sheet_name='AgiloPack')
-            wb = writer.book
-            ws = writer.sheets['AgiloPack']
-            hdr_fmt = wb.add_format({'bold': True, 'bg_color': '#111111', 'font_color': '#cccccc',
-                                      'font_name': 'Arial', 'font_size': 9, 'border': 1})
-            for ci, col in enumerate(export_cols):
-                ws.write(0, ci, col, hdr_fmt)
-                ws.set_column(ci, ci, max(len(col) + 2, 14))
+        layout_label = st.radio("Report layout", list(EXPORT_LAYOUTS), horizontal=True)
+        layout = EXPORT_LAYOUTS[layout_label]
+
+        # Build each workbook once per result across all sessions, not on every rerun
+        report = shared_get(
+            SHARED.reports, (st.session_state.data['result_key'], layout, min_util),
+            lambda: gated(lambda: build_excel_report(all_df, layout, min_util))
+        )
 
         col1, col2 = st.columns([1, 5])
         with col1:
             st.download_button(
                 "↓ Download Report",
-                data=output.getvalue(),
-                file_name='AgiloPack_Results.xlsx',
+                data=report,
+                file_name='AgiloPack_Results.xlsx' if layout == "full" else f'AgiloPack_Results_{layout}.xlsx',
                 mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             )
         with col2:
@@ -802,3 +535,18 @@ elif st.session_state.step == 2:
             "Excel · Without Weight: Opt1 & Opt2 = rd(L)×rd(W)×rd(H) · No Tare"
         )
         st.markdown(f'<p class="dl-hint">{engine_note}</p>', unsafe_allow_html=True)
+
+# ── Session memory accounting ─────────────────────────────────────────────────
+MB = 1024 * 1024
+ctx = get_script_run_ctx()
+own_bytes, shared_bytes = SHARED.account(
+    ctx.session_id if ctx else "local", st.session_state.data,
+    is_active=runtime.get_instance().is_active_session if runtime.exists() else None,
+)
+n_sessions, owned_bytes, pooled_bytes = SHARED.server_usage()
+st.markdown(
+    f'<p class="dl-hint">Memory · this session {own_bytes / MB:.1f} MB own + {shared_bytes / MB:.1f} MB shared'
+    f' · server {n_sessions} session{"s" if n_sessions != 1 else ""}, {(owned_bytes + pooled_bytes) / MB:.1f} MB'
+    f' · analyses {SHARED.gate.running}/{SHARED.gate.slots} running, {SHARED.gate.waiting} queued</p>',
+    unsafe_allow_html=True
+)
@@ -0,0 +1,372 @@
+"""AgiloPack HTTP service — pack quantities on demand for WMS / ERP integrations.
+
+Run with:
+    uvicorn service:app --host 0.0.0.0 --port 8600
+
+Endpoints
+    GET  /healthz         liveness probe
+    GET  /v1/catalogues   catalogue ids and their boxes
+    POST /v1/pack         batch of parts → best qty per part per box
+    GET  /metrics         request / batch counters and p50 / p99 latency
+
+Catalogue lookups are served from the precomputed index (packindex.py) when one
+has been built, falling back to the engine for parts it does not cover.
+
+/v1/pack accepts JSON:
+    {"catalogue": "with_weight", "parts": [{"Part No": "P1", "Length": 50, ...}],
+     "custom_box": [400, 300, 200], "custom_tare": 0.5, "custom_cost": 2.4,
+     "box_costs": {"A": 0.8, "B": 1.1}}          # custom_* and box_costs optional
+or an Arrow IPC stream (Content-Type: application/vnd.apache.arrow.stream) with
+the other fields passed in the query string (?catalogue=...&box_costs=A:0.8,B:1.1).
+An Arrow response is returned when the request's Accept header asks for it.
+box_costs / custom_cost fill the "Cost / Part" column.
+"""
+import asyncio
+import io
+import json
+import math
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+import pandas as pd
+
+from packengine import CATALOGUES, get_col, run_analysis
+from packindex import PackIndex
+
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+
+BATCH_WINDOW_S  = 0.005    # how long a request waits for others to join its batch
+BATCH_MAX_PARTS = 5000     # flush early once a batch holds this many parts
+LATENCY_WINDOW  = 4096     # number of recent requests kept for percentiles
+
+
+class BadRequest(Exception):
+    pass
+
+
+# ── Input normalisation ───────────────────────────────────────────────────────
+
+def normalise_parts(df, has_weight):
+    """Map flexible column names onto the canonical set so batches concat cleanly."""
+    col_part_no   = get_col(df, "Part No", "Part ID", "PartNo", "Part Number")
+    col_part_desc = get_col(df, "Part Description", "Part Desc", "Description", "Part Name")
+    dims = {name: get_col(df, name) for name in ("Length", "Width", "Height")}
+    missing = [name for name, col in dims.items() if col is None]
+    if missing:
+        raise BadRequest(f"missing column(s): {', '.join(missing)}")
+
+    out = pd.DataFrame({
+        # Number parts per request — the engine's fallback uses the (batch-wide) row index
+        "Part No": (df[col_part_no].astype(str) if col_part_no
+                    else pd.Series([f"Part {i+1}" for i in range(len(df))], index=df.index)),
+        "Part Description": df[col_part_desc] if col_part_desc else "",
+    })
+    for name, col in dims.items():
+        out[name] = pd.to_numeric(df[col], errors="coerce")
+    if out[list(dims)].isna().any().any() or (out[list(dims)] <= 0).any().any():
+        raise BadRequest("Length, Width and Height must be positive numbers")
+
+    col_unit_wt = get_col(df, "Unit Weight")
+    if has_weight:
+        out["Unit Weight"] = df[col_unit_wt] if col_unit_wt else None
+    return out.reset_index(drop=True)
+
+
+def parse_request(body, content_type, query):
+    """Return (batch key, parts frame) for a /v1/pack request."""
+    if content_type.startswith(ARROW_MIME):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise BadRequest("Arrow input requires pyarrow on the server")
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        df = pa.ipc.open_stream(body).read_pandas()
+        custom_box = params.get("custom_box")
+        if custom_box:
+            custom_box = custom_box.split(",")
+        box_costs = params.get("box_costs")
+        if box_costs:
+            try:
+                box_costs = dict(item.split(":", 1) for item in box_costs.split(","))
+            except ValueError:
+                raise BadRequest("box_costs must look like A:0.8,B:1.1")
+    else:
+        try:
+            params = json.loads(body or b"{}")
+        except ValueError:
+            raise BadRequest("body is not valid JSON")
+        if not isinstance(params, dict) or not isinstance(params.get("parts"), list):
+            raise BadRequest("expected an object with a 'parts' array")
+        df = pd.DataFrame(params["parts"])
+        custom_box = params.get("custom_box")
+        box_costs = params.get("box_costs")
+
+    catalogue_id = params.get("catalogue", "without_weight")
+    if catalogue_id not in CATALOGUES:
+        raise BadRequest(f"unknown catalogue {catalogue_id!r}; expected one of {sorted(CATALOGUES)}")
+    boxes, has_weight = CATALOGUES[catalogue_id]
+
+    if custom_box is not None:
+        try:
+            custom_box = tuple(float(x) for x in custom_box)
+            custom_tare = float(params.get("custom_tare", 0.0))
+            custom_cost = params.get("custom_cost")
+            custom_cost = None if custom_cost in (None, "") else float(custom_cost)
+        except (TypeError, ValueError):
+            raise BadRequest("custom_box must be three numbers, custom_tare and custom_cost numbers")
+        if len(custom_box) != 3 or min(custom_box) <= 0:
+            raise BadRequest("custom_box must be three positive numbers")
+        if custom_cost is not None and custom_cost < 0:
+            raise BadRequest("custom_cost must not be negative")
+        key = (catalogue_id, custom_box, custom_tare, custom_cost)
+    else:
+        if box_costs is not None and not isinstance(box_costs, dict):
+            raise BadRequest("box_costs must map box ids to a cost per box")
+        try:
+            costs = {str(k): float(v) for k, v in (box_costs or {}).items()}
+        except (TypeError, ValueError):
+            raise BadRequest("box_costs values must be numbers")
+        unknown = sorted(set(costs) - set(boxes))
+        if unknown or any(c < 0 for c in costs.values()):
+            raise BadRequest(f"box_costs needs non-negative costs for boxes in {sorted(boxes)}")
+        key = (catalogue_id, None, 0.0, tuple(sorted(costs.items())))
+
+    return key, normalise_parts(df, has_weight) if len(df) else df
+
+
+def boxes_per_part(key):
+    catalogue_id, custom_box, _, _ = key
+    return 1 if custom_box is not None else len(CATALOGUES[catalogue_id][0])
+
+
+# Precomputed indexes by catalogue id, opened in warm_up()
+indexes = {}
+
+
+def analyse(key, df):
+    catalogue_id, custom_box, custom_tare, costs = key
+    _, has_weight = CATALOGUES[catalogue_id]
+    if custom_box is not None:
+        return run_analysis(df, "Manual", custom_box, custom_tare, has_weight, custom_cost=costs)
+    box_costs = dict(costs) or None
+    if catalogue_id in indexes:
+        return indexes[catalogue_id].analyse(df, box_costs=box_costs)
+    return run_analysis(df, "Catalogue", has_weight=has_weight, box_costs=box_costs)
+
+
+# ── Request batching ──────────────────────────────────────────────────────────
+
+class PackBatcher:
+    """Coalesce concurrent requests for the same catalogue into one engine call.
+
+    The first request for a key opens a short window; everything that arrives
+    for that key before it closes is concatenated, analysed once in a worker
+    thread, and the result rows are sliced back per request.
+    """
+
+    def __init__(self, window=BATCH_WINDOW_S, max_parts=BATCH_MAX_PARTS):
+        self.window = window
+        self.max_parts = max_parts
+        self.batches = 0
+        self._pending = {}
+        self._timers = {}      # key → TimerHandle closing that key's current window
+
+    async def submit(self, key, df):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        bucket = self._pending.setdefault(key, [])
+        bucket.append((df, fut))
+        if len(bucket) == 1:
+            self._timers[key] = loop.call_later(self.window, lambda: asyncio.ensure_future(self._flush(key)))
+        elif sum(len(d) for d, _ in bucket) >= self.max_parts:
+            asyncio.ensure_future(self._flush(key))
+        return await fut
+
+    async def _flush(self, key):
+        # An early (max_parts) flush must not leave this window's timer to cut the next one short
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        bucket = self._pending.pop(key, None)
+        if not bucket:
+            return
+        self.batches += 1
+        merged = pd.concat([d for d, _ in bucket], ignore_index=True)
+        try:
+            res = await asyncio.get_running_loop().run_in_executor(None, analyse, key, merged)
+        except Exception as exc:
+            for _, fut in bucket:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+
+        per_part = boxes_per_part(key)
+        offset = 0
+        for d, fut in bucket:
+            n = len(d) * per_part
+            if not fut.done():
+                part = res.iloc[offset:offset + n].reset_index(drop=True)
+                # Part Row counts across the merged batch; renumber it within this request
+                part["Part Row"] -= offset // per_part
+                fut.set_result(part)
+            offset += n
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+
+class LatencyTracker:
+    """Rolling window of request latencies with nearest-rank percentiles."""
+
+    def __init__(self, size=LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self.requests = 0
+        self.parts = 0
+        self.errors = 0
+
+    def record(self, seconds, parts):
+        self._samples.append(seconds)
+        self.requests += 1
+        self.parts += parts
+
+    def percentile(self, q):
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))
+        return round(ordered[idx] * 1000, 3)
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "parts":    self.parts,
+            "errors":   self.errors,
+            "p50_ms":   self.percentile(50),
+            "p99_ms":   self.percentile(99),
+        }
+
+
+# ── ASGI app ──────────────────────────────────────────────────────────────────
+
+batcher = PackBatcher()
+metrics = LatencyTracker()
+
+
+def warm_up():
+    """Open any precomputed indexes and run each catalogue once before traffic."""
+    for catalogue_id in CATALOGUES:
+        index = PackIndex.open(catalogue_id)
+        if index is not None:
+            indexes[catalogue_id] = index
+    probe = pd.DataFrame([{"Part No": "warmup", "Length": 10, "Width": 10, "Height": 10,
+                           "Unit Weight": 0.1}])
+    for catalogue_id in CATALOGUES:
+        analyse((catalogue_id, None, 0.0, ()), probe)
+
+
+def catalogues_payload():
+    return {
+        cid: {
+            "has_weight": has_weight,
+            "boxes": {k: {"dims": list(v["dims"]), "tare": v["tare"], "type": v["type"]}
+                      for k, v in boxes.items()},
+        }
+        for cid, (boxes, has_weight) in CATALOGUES.items()
+    }
+
+
+def results_payload(res):
+    return {"results": res.to_dict(orient="records")}
+
+
+def arrow_bytes(res):
+    import pyarrow as pa
+
+    # Missing weights / costs are "—" alongside numbers; Arrow needs one type per column
+    table = pa.Table.from_pandas(res.astype({"Box Weight (kg)": str, "Cost / Part": str}),
+                                 preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_response(send, status, body, content_type="application/json"):
+    if not isinstance(body, bytes):
+        body = json.dumps(body, default=str).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def handle_pack(scope, receive, send):
+    started = time.perf_counter()
+    headers = {k.decode().lower(): v.decode() for k, v in scope.get("headers", [])}
+    try:
+        key, df = parse_request(await read_body(receive), headers.get("content-type", ""),
+                                scope.get("query_string", b"").decode())
+    except BadRequest as exc:
+        metrics.errors += 1
+        return await send_response(send, 400, {"error": str(exc)})
+    except Exception as exc:
+        metrics.errors += 1
+        return await send_response(send, 400, {"error": f"could not read parts: {exc}"})
+
+    try:
+        res = await batcher.submit(key, df) if len(df) else pd.DataFrame()
+    except Exception as exc:
+        metrics.errors += 1
+        return await send_response(send, 500, {"error": f"analysis failed: {exc}"})
+
+    try:
+        if ARROW_MIME in headers.get("accept", "") and len(res):
+            body, content_type = arrow_bytes(res), ARROW_MIME
+        else:
+            body, content_type = json.dumps(results_payload(res), default=str).encode(), "application/json"
+    except Exception as exc:
+        metrics.errors += 1
+        return await send_response(send, 500, {"error": f"could not encode results: {exc}"})
+    metrics.record(time.perf_counter() - started, len(df))
+    return await send_response(send, 200, body, content_type)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                warm_up()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    method, path = scope["method"], scope["path"]
+    if path == "/healthz" and method == "GET":
+        return await send_response(send, 200, {"status": "ok"})
+    if path == "/v1/catalogues" and method == "GET":
+        return await send_response(send, 200, catalogues_payload())
+    if path == "/metrics" and method == "GET":
+        return await send_response(send, 200, {**metrics.snapshot(), "batches": batcher.batches,
+                                               "index_entries": {k: len(v) for k, v in indexes.items()}})
+    if path == "/v1/pack":
+        if method != "POST":
+            return await send_response(send, 405, {"error": "use POST"})
+        return await handle_pack(scope, receive, send)
+    return await send_response(send, 404, {"error": f"no route for {path}"})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=8600)
@@ -0,0 +1,187 @@
+"""Process-wide state shared by every Streamlit session on one server.
+
+packquan.py keeps a single SharedState per process (via st.cache_resource) so
+concurrent planners reuse each other's parsed uploads, results and reports
+instead of each session holding its own copy, and heavy analyses queue behind
+a fixed number of slots.
+
+Values handed out by a SharedStore are shared between sessions and must be
+treated as read-only.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+MAX_UPLOADS              = 16     # parsed part masters kept across sessions
+MAX_RESULTS              = 32     # analysis / sweep frames kept across sessions
+MAX_REPORTS              = 32     # rendered xlsx / csv downloads kept across sessions
+MAX_CONCURRENT_ANALYSES  = 2      # heavy runs allowed at once; the rest queue
+SESSION_STALE_S          = 10 * 60  # fallback when the runtime can't list live sessions
+WAIT_POLL_S              = 1.0      # how often a session waiting on another's compute checks in
+
+
+class SharedStore:
+    """Thread-safe LRU keyed by content hash, computing each missing key only once.
+
+    If several sessions ask for the same missing key at the same time, the first
+    computes it and the others wait for that result, calling on_wait() every
+    WAIT_POLL_S so the waiting session can show feedback or be stopped.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._inflight = {}
+
+    def get_or_compute(self, key, compute, on_wait=None):
+        while True:
+            with self._lock:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    return self._items[key]
+                event = self._inflight.get(key)
+                owner = event is None
+                if owner:
+                    event = self._inflight[key] = threading.Event()
+            if not owner:
+                # Another session is computing it; on failure the next loop retries
+                while not event.wait(WAIT_POLL_S):
+                    if on_wait:
+                        on_wait()
+                continue
+            try:
+                value = compute()
+                with self._lock:
+                    self._items[key] = value
+                    while len(self._items) > self.max_entries:
+                        self._items.popitem(last=False)
+                return value
+            finally:
+                with self._lock:
+                    self._inflight.pop(key).set()
+
+    def holds(self, value):
+        with self._lock:
+            return any(v is value for v in self._items.values())
+
+    def nbytes(self):
+        with self._lock:
+            values = list(self._items.values())
+        return sum(object_nbytes(v) for v in values)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class AnalysisGate:
+    """Cap on concurrent heavy analyses; callers beyond the cap wait in FIFO-ish order."""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self._sem = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self.running = 0
+        self.waiting = 0
+
+    @contextmanager
+    def slot(self, on_wait=None):
+        """Hold a slot for the duration of the block.
+
+        While queued, on_wait(position) is called on entry and every WAIT_POLL_S,
+        so the waiting session can show feedback or be stopped.
+        """
+        if not self._sem.acquire(blocking=False):
+            with self._lock:
+                self.waiting += 1
+                position = self.waiting
+            try:
+                if on_wait:
+                    on_wait(position)
+                while not self._sem.acquire(timeout=WAIT_POLL_S):
+                    if on_wait:
+                        on_wait(position)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+        with self._lock:
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+            self._sem.release()
+
+
+class SharedState:
+    def __init__(self):
+        self.uploads  = SharedStore(MAX_UPLOADS)
+        self.results  = SharedStore(MAX_RESULTS)
+        self.reports  = SharedStore(MAX_REPORTS)
+        self.gate     = AnalysisGate(MAX_CONCURRENT_ANALYSES)
+        self._lock    = threading.Lock()
+        self._sessions = {}     # session id → ({id(value): bytes} not in a store, last seen)
+
+    @property
+    def stores(self):
+        return (self.uploads, self.results, self.reports)
+
+    def is_shared(self, value):
+        return any(store.holds(value) for store in self.stores)
+
+    def account(self, session_id, data, is_active=None):
+        """Record this session's own (non-shared) memory; returns (own, shared) bytes.
+
+        is_active(session_id) tells whether a recorded session is still connected;
+        without it, sessions not seen for SESSION_STALE_S are dropped instead.
+        """
+        own, shared = {}, 0
+        for value in _leaves(data):
+            size = object_nbytes(value)
+            if self.is_shared(value):
+                shared += size
+            else:
+                own[id(value)] = size
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (own, now)
+            for sid, (_, seen) in list(self._sessions.items()):
+                gone = not is_active(sid) if is_active else now - seen > SESSION_STALE_S
+                if sid != session_id and gone:
+                    del self._sessions[sid]
+        return sum(own.values()), shared
+
+    def server_usage(self):
+        """(active sessions, bytes owned by sessions, bytes held in shared stores).
+
+        A value evicted from a store but still held by several sessions is
+        counted once.
+        """
+        with self._lock:
+            owned = {}
+            for values, _ in self._sessions.values():
+                owned.update(values)
+            sessions = len(self._sessions)
+        return sessions, sum(owned.values()), sum(store.nbytes() for store in self.stores)
+
+
+def _leaves(value):
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _leaves(v)
+    else:
+        yield value
+
+
+def object_nbytes(value):
+    """Approximate memory held by a cached value (frames counted deep)."""
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(object_nbytes(v) for v in value.values())
+    return 0